@@ -8,17 +8,95 @@ Nasłuchuje zmian w FreeIPA i automatycznie:
 """
 
 import asyncio
+import base64
+import functools
+import itertools
+import json
 import logging
+import os
+import re
+import sqlite3
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, asynccontextmanager
 from typing import Optional
 from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
 from enum import Enum
 
 import ldap3
-from ldap3 import Server, Connection, SUBTREE, MODIFY_REPLACE
+from ldap3 import (
+    Server, ServerPool, Connection, Tls, SUBTREE, LEVEL, MODIFY_REPLACE, ASYNC,
+    ASYNC_STREAM, RESTARTABLE, ROUND_ROBIN, NONE
+)
+from ldap3.core.exceptions import LDAPOperationResult
+from ldap3.utils.config import set_config_parameter
+from ldap3.utils.conv import escape_filter_chars
 
-logging.basicConfig(level=logging.INFO)
+try:
+    import uvloop  # opcjonalnie - szybsza pętla zdarzeń
+except ImportError:
+    uvloop = None
+
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
 logger = logging.getLogger(__name__)
 
+# Połączenia RESTARTABLE ponawiają operację po zerwaniu (np. restart repliki)
+set_config_parameter('RESTARTABLE_TRIES', 5)
+
+# Po ilu sekundach ponownie próbować serwera IPA, który nie odpowiadał
+SERVER_RETRY_AFTER = 60
+
+# Co ile sekund sprawdzać, czy połączenie persistent search nadal żyje
+PSEARCH_CHECK_INTERVAL = 5
+
+# Zakładka kursora (sekundy) - zmiany z opóźnioną replikacją lub z tym samym
+# modifyTimestamp co ostatni wpis nie wypadają poza filtr kolejnego resyncu
+CURSOR_OVERLAP = 300
+CURSOR_FORMAT = "%Y%m%d%H%M%SZ"
+
+# Opóźnienie ponownego otwarcia zerwanego persistent search (bez pętli
+# natychmiastowych reconnectów, gdy serwer od razu zamyka połączenie)
+PSEARCH_RECONNECT_DELAY = 1
+
+# Co ile sekund ponownie czytać istniejące aliasy (np. usunięte ręcznie)
+ALIASES_REFRESH_INTERVAL = 3600
+
+# Adaptacyjny polling (gdy persistent search nie działa)
+POLL_MIN_DELAY = 5
+POLL_MAX_DELAY = 300
+POLL_DEFAULT_DELAY = 60
+POLL_HISTORY = 64  # ile ostatnich zmian pamiętać
+POLL_HISTOGRAM_BINS = 16
+
+# Filtry LDAP - stałe, bez składania stringów w każdym cyklu
+# Persistent search: użytkownicy oraz OU (nowa klasa -> alias klasa-*)
+_FILTER_PSEARCH = "(|(objectClass=person)(objectClass=organizationalUnit))"
+_FILTER_NEW_USERS = "(&(objectClass=posixAccount)(uid=*)(!(mail=*))(!(nsAccountLock=TRUE)))"
+_FILTER_DISABLED_USERS = "(&(objectClass=posixAccount)(nsAccountLock=TRUE)(mail=*))"
+_FILTER_ALIASES = "(objectClass=groupOfURLs)"
+_FILTER_CLASSES = "(objectClass=organizationalUnit)"
+_FILTER_ALIAS_MEMBERS = "(&(objectClass=posixAccount)(!(nsAccountLock=TRUE)))"
+
+# Pamięć już obsłużonych użytkowników (pomija powtórne doveadm/rsync)
+HANDLED_TTL = 3600
+HANDLED_MAXSIZE = 100_000
+
+# doveadm HTTP API Dovecota i limit czasu wywołania (sekundy)
+DEFAULT_DOVEADM_URL = "http://dovecot-doveadm.mail-system.svc:8080/doveadm/v1"
+DOVEADM_TIMEOUT = 30
+
+# Foldery tworzone w nowej skrzynce
+DEFAULT_FOLDERS = ("Sent", "Drafts", "Trash", "Junk")
+
+# Trwały stan (kursor, obsłużeni użytkownicy) - przetrwa restart poda
+DEFAULT_STATE_PATH = "/var/lib/mail-provisioner/state.db"
+
+# Archiwum skrzynek dezaktywowanych (PVC mail-archive)
+DEFAULT_ARCHIVE_PATH = "/archive/mail"
+
 
 class UserRole(Enum):
     """Role użytkowników w systemie."""
@@ -28,20 +106,40 @@ class UserRole(Enum):
     DYREKCJA = "dyrekcja"
 
 
-@dataclass
+# Rola po nazwie OU - jedno przejście regexem zamiast kilku testów "in"
+_OU_RE = re.compile(r"ou=(uczniowie|nauczyciele|administracja|dyrekcja)", re.IGNORECASE)
+_ROLE_BY_TOKEN = {
+    "uczniowie": UserRole.UCZEN,
+    "nauczyciele": UserRole.NAUCZYCIEL,
+    "administracja": UserRole.ADMINISTRACJA,
+    "dyrekcja": UserRole.DYREKCJA,
+}
+
+
+@dataclass(slots=True, frozen=True)
 class MailConfig:
     """Konfiguracja serwera pocztowego."""
     domain: str = "zsel.opole.pl"
     maildir_base: str = "/var/mail/vhosts"
     
+    # Archiwum skrzynek dezaktywowanych (PVC mail-archive)
+    archive_base: str = DEFAULT_ARCHIVE_PATH
+    
+    # doveadm HTTP API na podzie Dovecota (provisioner nie ma binarki doveadm)
+    doveadm_url: str = DEFAULT_DOVEADM_URL
+    doveadm_api_key: str = ""  # Z env lub secret
+    
     # Quota w bajtach
     quota_uczen: int = 1 * 1024 * 1024 * 1024  # 1 GB
     quota_nauczyciel: int = 5 * 1024 * 1024 * 1024  # 5 GB
     quota_admin: int = 10 * 1024 * 1024 * 1024  # 10 GB
     quota_dyrekcja: int = 20 * 1024 * 1024 * 1024  # 20 GB
+    
+    # Maksymalna liczba równoległych wywołań doveadm/rsync
+    max_parallel: int = 16
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class FreeIPAConfig:
     """Konfiguracja połączenia z FreeIPA."""
     server: str = "ipa1.zsel.opole.pl"
@@ -49,6 +147,16 @@ class FreeIPAConfig:
     bind_dn: str = "uid=mail-provisioner,cn=sysaccounts,cn=etc,dc=zsel,dc=opole,dc=pl"
     bind_password: str = ""  # Z env lub secret
     
+    # Dodatkowe repliki IPA (ServerPool, round-robin)
+    replicas: tuple = ()
+    
+    # Liczba połączeń w puli (równoległe wyszukiwania i modyfikacje)
+    pool_size: int = 8
+    
+    # Aliasy grupowe (groupOfURLs) i OU z klasami (aliasy klasa-*)
+    aliases_ou: str = "ou=aliases"
+    classes_ou: str = "ou=uczniowie"
+    
     # OU do obserwowania
     watch_ous: tuple = (
         "ou=uczniowie",
@@ -57,13 +165,184 @@ class FreeIPAConfig:
     )
 
 
+def _attribute_value(entry: dict, attribute: str) -> Optional[str]:
+    """Zwraca pierwszą wartość atrybutu z odpowiedzi LDAP (lub None).
+    
+    Czyta surowe bajty (raw_attributes) i dekoduje je tylko raz.
+    """
+    values = entry['raw_attributes'].get(attribute)
+    return values[0].decode() if values else None
+
+
+@functools.lru_cache(maxsize=None)
+def _role_for_ou(ou: str) -> UserRole:
+    """Zwraca rolę dla OU (kilka możliwych wartości, więc wynik jest cache'owany)."""
+    match = _OU_RE.search(ou)
+    return _ROLE_BY_TOKEN[match.group(1).lower()] if match else UserRole.UCZEN
+
+
+@functools.lru_cache(maxsize=2)
+def _changes_filter(last_seen_ts: str, users_filter: str) -> str:
+    """Filtr zmian od kursora (ten sam kursor -> ten sam string z cache)."""
+    since = _cursor_with_overlap(last_seen_ts)
+    return f"(&(modifyTimestamp>={escape_filter_chars(since)}){users_filter})"
+
+
+def _cursor_with_overlap(last_seen_ts: str) -> str:
+    """Cofa kursor o CURSOR_OVERLAP sekund (nieznany format - bez zmian)."""
+    try:
+        since = datetime.strptime(last_seen_ts, CURSOR_FORMAT)
+    except ValueError:
+        return last_seen_ts
+    return (since - timedelta(seconds=CURSOR_OVERLAP)).strftime(CURSOR_FORMAT)
+
+
+class _TTLSet:
+    """Zbiór kluczy z czasem życia (TTL) i limitem rozmiaru."""
+    
+    def __init__(self, ttl: float, maxsize: int):
+        self._ttl = ttl
+        self._maxsize = maxsize
+        self._items: dict[str, float] = {}
+        
+    def __contains__(self, key: str) -> bool:
+        added = self._items.get(key)
+        return added is not None and time.monotonic() - added < self._ttl
+        
+    def add(self, key: str) -> None:
+        # Ponowne wstawienie przesuwa klucz na koniec (kolejność = wiek)
+        self._items.pop(key, None)
+        self._items[key] = time.monotonic()
+        if len(self._items) > self._maxsize:
+            del self._items[next(iter(self._items))]
+            
+    def discard(self, key: str) -> None:
+        self._items.pop(key, None)
+
+
+class ProvisionerState:
+    """
+    Stan provisionera zapisywany na dysku (SQLite).
+    
+    Przechowuje kursor modifyTimestamp oraz użytkowników, dla których
+    skrzynka została już utworzona lub zarchiwizowana - po restarcie
+    provisioner wznawia pracę od kursora zamiast od całego katalogu.
+    Znaczniki obsłużenia wygasają po ttl sekundach (jak _TTLSet), a
+    wygasłe wiersze są usuwane przy starcie i przy zapisie kursora.
+    """
+    
+    def __init__(self, path: str = DEFAULT_STATE_PATH, ttl: float = HANDLED_TTL):
+        self._ttl = ttl
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS cursor (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                last_seen_ts TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS handled (
+                uid TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                handled_at REAL NOT NULL,
+                PRIMARY KEY (uid, kind)
+            );
+            """
+        )
+        
+        # Baza sprzed kolumny handled_at - stare wiersze traktowane jak wygasłe
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(handled)")}
+        if "handled_at" not in columns:
+            with self._db:
+                self._db.execute(
+                    "ALTER TABLE handled ADD COLUMN handled_at REAL NOT NULL DEFAULT 0"
+                )
+                
+        with self._db:
+            self._prune()
+            
+    def load_cursor(self) -> Optional[str]:
+        """Zwraca zapisany kursor modifyTimestamp (lub None)."""
+        row = self._db.execute("SELECT last_seen_ts FROM cursor").fetchone()
+        return row[0] if row else None
+        
+    def save_cursor(self, last_seen_ts: str) -> None:
+        """Zapisuje kursor modifyTimestamp (i usuwa wygasłe znaczniki)."""
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cursor (id, last_seen_ts) VALUES (0, ?)",
+                (last_seen_ts,)
+            )
+            self._prune()
+            
+    def is_handled(self, uid: str, kind: str) -> bool:
+        """Sprawdza, czy użytkownik został obsłużony (provisioned/archived)."""
+        return self._db.execute(
+            "SELECT 1 FROM handled WHERE uid = ? AND kind = ? AND handled_at > ?",
+            (uid, kind, time.time() - self._ttl)
+        ).fetchone() is not None
+        
+    def update_handled(self, marked: list, forgotten: list) -> None:
+        """
+        Zapisuje i usuwa znaczniki obsłużenia jedną transakcją.
+        
+        Args:
+            marked: Pary (uid, kind) obsłużone teraz
+            forgotten: Pary (uid, kind) do zapomnienia
+        """
+        now = time.time()
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO handled (uid, kind, handled_at) VALUES (?, ?, ?)",
+                [(uid, kind, now) for uid, kind in marked]
+            )
+            self._db.executemany(
+                "DELETE FROM handled WHERE uid = ? AND kind = ?", forgotten
+            )
+            
+    def _prune(self) -> None:
+        """Usuwa wygasłe znaczniki (wywoływane w otwartej transakcji)."""
+        self._db.execute(
+            "DELETE FROM handled WHERE handled_at <= ?", (time.time() - self._ttl,)
+        )
+
+
 class MailboxManager:
     """Zarządzanie skrzynkami pocztowymi."""
     
-    def __init__(self, config: MailConfig):
+    def __init__(
+        self,
+        config: MailConfig,
+        state: Optional[ProvisionerState] = None
+    ):
         self.config = config
+        self.state = state
+        self._suffix = "@" + config.domain
+        self._archive_prefix = config.archive_base.rstrip("/") + "/"
+        self._doveadm_auth = "X-Dovecot-API " + base64.b64encode(
+            config.doveadm_api_key.encode()
+        ).decode()
+        self._maildir_prefix = f"{config.maildir_base}/{config.domain}/"
+        self._quota = {
+            UserRole.UCZEN: config.quota_uczen,
+            UserRole.NAUCZYCIEL: config.quota_nauczyciel,
+            UserRole.ADMINISTRACJA: config.quota_admin,
+            UserRole.DYREKCJA: config.quota_dyrekcja,
+        }
+        self._sem = asyncio.Semaphore(config.max_parallel)
+        
+        # Użytkownicy obsłużeni w tej sesji - kolejny cykl może ich zwrócić
+        # ponownie, zanim zapis atrybutu mail dotrze do wszystkich replik
+        self._provisioned = _TTLSet(HANDLED_TTL, HANDLED_MAXSIZE)
+        self._archived = _TTLSet(HANDLED_TTL, HANDLED_MAXSIZE)
         
-    async def create_mailbox(self, uid: str, role: UserRole) -> str:
+        # Znaczniki czekające na zapis do bazy stanu - flush_handled() zapisuje
+        # je jedną transakcją (commit SQLite per użytkownik blokowałby pętlę)
+        # (uid, kind) -> True = obsłużony, False = do zapomnienia
+        self._pending_handled: dict = {}
+        
+    async def create_mailbox(self, uid: str, role: UserRole) -> Optional[str]:
         """
         Tworzy nową skrzynkę pocztową.
         
@@ -72,23 +351,42 @@ class MailboxManager:
             role: Rola użytkownika
             
         Returns:
-            Adres email (np. 'jkowalski@zsel.opole.pl')
+            Adres email (np. 'jkowalski@zsel.opole.pl') lub None, gdy
+            utworzenie skrzynki się nie powiodło
         """
-        email = f"{uid}@{self.config.domain}"
+        email = uid + self._suffix
+        if uid in self._provisioned or self._is_handled(uid, "provisioned"):
+            return email
+            
         quota = self._get_quota(role)
         
-        # Tutaj integracja z Dovecot
-        # doveadm mailbox create -u {email}
-        logger.info(f"Tworzenie skrzynki: {email} (quota: {quota} bytes)")
+        logger.info("Tworzenie skrzynki: %s (quota: %d bytes)", email, quota)
+        
+        # Dovecot tworzy maildir przy pierwszym folderze. Tworzone są tylko
+        # brakujące foldery: "już istnieje" doveadm zgłasza tym samym kodem
+        # (65, DOVEADM_EX_NOTPOSSIBLE) co inne błędy, więc ponowna próba
+        # (np. po nieudanym zapisie mail) nie może na nim polegać
+        async with self._sem:
+            existing = await self._doveadm("mailboxList", user=email)
+            if existing is None:
+                return None
+            present = {row.get("mailbox") for row in existing if isinstance(row, dict)}
+            missing = [folder for folder in DEFAULT_FOLDERS if folder not in present]
+            if missing and await self._doveadm(
+                "mailboxCreate", user=email, mailbox=missing, subscriptions=True
+            ) is None:
+                return None
+            
+        self._provisioned.add(uid)
+        self._mark_handled(uid, "provisioned")
         
         # TODO: Implementacja
-        # - Utwórz maildir
         # - Ustaw quota
         # - Zarejestruj w bazie Dovecot
         
         return email
         
-    async def archive_mailbox(self, uid: str) -> str:
+    async def archive_mailbox(self, uid: str) -> Optional[str]:
         """
         Archiwizuje skrzynkę (read-only).
         
@@ -96,15 +394,37 @@ class MailboxManager:
             uid: Login użytkownika
             
         Returns:
-            Ścieżka do archiwum
+            Ścieżka do archiwum lub None, gdy kopia się nie powiodła
         """
-        email = f"{uid}@{self.config.domain}"
-        archive_path = f"/archive/mail/{uid}"
+        email = uid + self._suffix
+        archive_path = self._archive_prefix + uid
+        if uid in self._archived or self._is_handled(uid, "archived"):
+            return archive_path
+            
+        # Bez zamontowanego archiwum rsync pisałby do efemerycznego FS poda
+        if not os.path.ismount(self.config.archive_base):
+            logger.error(
+                "Archiwum %s nie jest zamontowane - pomijam %s",
+                self.config.archive_base, email
+            )
+            return None
+            
+        logger.info("Archiwizacja skrzynki: %s -> %s", email, archive_path)
         
-        logger.info(f"Archiwizacja skrzynki: {email} -> {archive_path}")
+        async with self._sem:
+            copied = await self._run(
+                "rsync", "-a", "--fsync",
+                self._maildir_prefix + uid + "/", archive_path + "/"
+            )
+        if not copied:
+            return None
+            
+        self._archived.add(uid)
+        self._provisioned.discard(uid)
+        self._mark_handled(uid, "archived")
+        self._forget(uid, "provisioned")
         
         # TODO: Implementacja
-        # - Backup maildir do archive
         # - Ustaw read-only
         # - Wyłącz dostarczanie nowych wiadomości
         
@@ -117,23 +437,103 @@ class MailboxManager:
         Args:
             uid: Login użytkownika
         """
-        email = f"{uid}@{self.config.domain}"
-        logger.warning(f"Permanentne usunięcie skrzynki: {email}")
+        email = uid + self._suffix
+        logger.warning("Permanentne usunięcie skrzynki: %s", email)
         
         # TODO: Implementacja
         # - Sprawdź czy minął okres retencji
         # - Usuń archiwum
         # - Usuń z bazy Dovecot
         
+    def mark_active(self, uid: str) -> None:
+        """Zapomina archiwizację reaktywowanego użytkownika."""
+        self._archived.discard(uid)
+        if self._is_handled(uid, "archived"):
+            self._forget(uid, "archived")
+        
+    def flush_handled(self) -> None:
+        """Zapisuje zebrane znaczniki obsłużenia do bazy stanu."""
+        if not self._pending_handled:
+            return
+        pending, self._pending_handled = self._pending_handled, {}
+        self.state.update_handled(
+            [key for key, handled in pending.items() if handled],
+            [key for key, handled in pending.items() if not handled]
+        )
+        
+    def _is_handled(self, uid: str, kind: str) -> bool:
+        pending = self._pending_handled.get((uid, kind))
+        if pending is not None:
+            return pending
+        return self.state is not None and self.state.is_handled(uid, kind)
+        
+    def _mark_handled(self, uid: str, kind: str) -> None:
+        if self.state is not None:
+            self._pending_handled[(uid, kind)] = True
+            
+    def _forget(self, uid: str, kind: str) -> None:
+        if self.state is not None:
+            self._pending_handled[(uid, kind)] = False
+            
+    async def _doveadm(self, command: str, **parameters) -> Optional[list]:
+        """
+        Wywołuje komendę doveadm HTTP API.
+        
+        Returns:
+            Wiersze odpowiedzi (doveadmResponse) lub None przy błędzie
+        """
+        request = urllib.request.Request(
+            self.config.doveadm_url,
+            data=json.dumps([[command, parameters, "provisioner"]]).encode(),
+            headers={
+                "Authorization": self._doveadm_auth,
+                "Content-Type": "application/json",
+            }
+        )
+        try:
+            response = await asyncio.to_thread(self._http_call, request)
+            kind, result, _ = response[0]
+        except (OSError, ValueError, LookupError, TypeError) as e:
+            logger.error("doveadm %s: %s", command, e)
+            return None
+            
+        if kind != "doveadmResponse":
+            logger.error(
+                "doveadm %s zakończony błędem dla %s: %s",
+                command, parameters.get("user"), result
+            )
+            return None
+        return result if isinstance(result, list) else []
+        
+    @staticmethod
+    def _http_call(request: urllib.request.Request) -> list:
+        with urllib.request.urlopen(request, timeout=DOVEADM_TIMEOUT) as response:
+            return json.load(response)
+            
+    async def _run(self, *argv: str) -> bool:
+        """Uruchamia polecenie (rsync); zwraca True przy sukcesie."""
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *argv,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
+            )
+        except OSError as e:
+            logger.error("Nie można uruchomić %s: %s", argv[0], e)
+            return False
+        _, stderr = await process.communicate()
+        
+        if process.returncode != 0:
+            logger.error(
+                "%s zakończony kodem %d: %s",
+                argv[0], process.returncode, stderr.decode(errors='replace').strip()
+            )
+            return False
+        return True
+        
     def _get_quota(self, role: UserRole) -> int:
         """Zwraca quota dla danej roli."""
-        quotas = {
-            UserRole.UCZEN: self.config.quota_uczen,
-            UserRole.NAUCZYCIEL: self.config.quota_nauczyciel,
-            UserRole.ADMINISTRACJA: self.config.quota_admin,
-            UserRole.DYREKCJA: self.config.quota_dyrekcja,
-        }
-        return quotas.get(role, self.config.quota_uczen)
+        return self._quota[role]
 
 
 class FreeIPAListener:
@@ -150,134 +550,634 @@ class FreeIPAListener:
     def __init__(
         self, 
         freeipa_config: FreeIPAConfig,
-        mailbox_manager: MailboxManager
+        mailbox_manager: MailboxManager,
+        state: Optional[ProvisionerState] = None
     ):
         self.config = freeipa_config
         self.mailbox_manager = mailbox_manager
-        self.connection: Optional[Connection] = None
+        self.state = state
+        self._servers: Optional[ServerPool] = None
+        self._pool: Optional[asyncio.Queue] = None
+        self._psearch_connection: Optional[Connection] = None
+        
+        # Połączenie do zapisu (ASYNC) - modyfikacje wysyłane pipeline'em
+        self._writer: Optional[Connection] = None
+        self._writer_lock = asyncio.Lock()
+        
+        # Wątki pobierające strony paged_search - własna pula, bo do zwolnienia
+        # połączenia potrzebny jest stan wątku (concurrent.futures.Future)
+        self._page_executor = ThreadPoolExecutor(
+            max_workers=freeipa_config.pool_size, thread_name_prefix="ldap-page"
+        )
+        
+        # Nazwy (cn) istniejących aliasów grupowych - ładowane przy pierwszym
+        # cyklu, po ALIASES_REFRESH_INTERVAL i po błędzie tworzenia aliasu
+        self._aliases: Optional[set] = None
+        self._aliases_loaded_at = 0.0
+        
+        # Kursor: najnowszy przetworzony modifyTimestamp (generalized time)
+        self._last_seen_ts = (state and state.load_cursor()) or "19700101000000Z"
+        
+        # Momenty zmian (modifyTimestamp jako czas epoki) dla adaptacyjnego pollingu
+        self._change_times: deque = deque(maxlen=POLL_HISTORY)
         
     async def connect(self) -> None:
-        """Nawiązuje połączenie z FreeIPA LDAP."""
-        server = Server(self.config.server, use_ssl=True)
-        self.connection = Connection(
-            server,
+        """Nawiązuje pulę połączeń z FreeIPA LDAP (wszystkie repliki)."""
+        tls = Tls(ciphers='ECDHE+AESGCM')
+        
+        # Bez pobierania schematu: atrybuty czytamy z raw_attributes
+        # (jedno dekodowanie UTF-8), formatowanie wg schematu byłoby zbędne
+        self._servers = ServerPool(
+            [
+                Server(host, use_ssl=True, tls=tls, get_info=NONE)
+                for host in (self.config.server, *self.config.replicas)
+            ],
+            ROUND_ROBIN,
+            active=True,
+            # Niedostępny serwer wraca do puli po SERVER_RETRY_AFTER sekundach
+            # (exhaust=True wyłączałby go na stałe - pula jest współdzielona)
+            exhaust=SERVER_RETRY_AFTER
+        )
+        
+        self._pool = asyncio.Queue(maxsize=self.config.pool_size)
+        for _ in range(self.config.pool_size):
+            connection = await asyncio.to_thread(
+                Connection,
+                self._servers,
+                user=self.config.bind_dn,
+                password=self.config.bind_password,
+                auto_bind=True,
+                client_strategy=RESTARTABLE,
+                auto_range=True,
+                read_only=True
+            )
+            self._pool.put_nowait(connection)
+            
+        self._writer = await asyncio.to_thread(
+            Connection,
+            self._servers,
             user=self.config.bind_dn,
             password=self.config.bind_password,
-            auto_bind=True
+            auto_bind=True,
+            client_strategy=ASYNC,
+            read_only=False
+        )
+        
+        logger.info(
+            "Połączono z FreeIPA: %s (pula: %d)",
+            self.config.server, self.config.pool_size
         )
-        logger.info(f"Połączono z FreeIPA: {self.config.server}")
         
+    @asynccontextmanager
+    async def _with_conn(self):
+        """Pobiera połączenie z puli na czas jednej operacji."""
+        connection = await self._pool.get()
+        try:
+            yield connection
+        finally:
+            self._pool.put_nowait(connection)
+            
     async def watch_users(self) -> None:
-        """Główna pętla obserwująca zmiany użytkowników."""
-        if not self.connection:
+        """
+        Główna pętla obserwująca zmiany użytkowników.
+        
+        FreeIPA (389-DS) wypycha zmienione wpisy przez persistent search,
+        więc pełne przeszukanie katalogu (resync) wykonywane jest tylko
+        przy starcie i po zerwaniu połączenia.
+        """
+        if self._pool is None:
             await self.connect()
             
         while True:
+            # Persistent search otwierany przed resynciem - zmiany z czasu
+            # resyncu czekają w kolejce zdarzeń i są przetwarzane po nim
+            psearch = None
+            delay = None
             try:
-                # Sprawdź nowych użytkowników bez atrybutu mail
-                await self._process_new_users()
-                
-                # Sprawdź dezaktywowanych
-                await self._process_disabled_users()
+                psearch = await asyncio.to_thread(self._open_persistent_search)
+            except Exception as e:
+                logger.error("Nie można otworzyć persistent search: %s", e)
                 
-                # Odśwież aliasy grupowe
+            try:
+                # Resync - zmiany z czasu, gdy persistent search nie działał
+                await self._process_changes()
                 await self._update_group_aliases()
                 
+                # Blokuje do zerwania połączenia persistent search
+                # Zerwany persistent search - reconnect od razu; adaptacyjne
+                # opóźnienie dla samego pollingu i gdy serwer odrzucił wyszukiwanie
+                if psearch is not None and await self._watch_persistent_search(psearch):
+                    delay = PSEARCH_RECONNECT_DELAY
+                    
             except Exception as e:
-                logger.error(f"Błąd w watch loop: {e}")
-                
-            # Poll co 60 sekund
-            await asyncio.sleep(60)
+                logger.error("Błąd w watch loop: %s", e)
+            finally:
+                # Przy błędzie resyncu lub handlera połączenie nadal jest
+                # otwarte - bez tego zostawałby osierocony persistent search
+                if psearch is not None and not self._psearch_connection.closed:
+                    await asyncio.to_thread(self._psearch_connection.unbind)
+                    
+            # Ponowna próba (resync + persistent search)
+            await asyncio.sleep(delay if delay is not None else self._next_poll_delay())
             
-    async def _process_new_users(self) -> None:
-        """Znajduje i przetwarza nowych użytkowników bez email."""
-        for ou in self.config.watch_ous:
-            search_base = f"{ou},{self.config.base_dn}"
+    def _record_change(self, timestamp: Optional[str]) -> None:
+        """
+        Zapamiętuje moment zmiany wpisu (jedna próbka na serię).
+        
+        Próbką jest modifyTimestamp, nie moment wykrycia - inaczej histogram
+        mierzyłby rytm samego pollera. Wpisy nie nowsze od kursora (zakładka
+        CURSOR_OVERLAP, ponawiane nieudane) ani od ostatniej próbki nie są
+        nową zmianą.
+        """
+        if not timestamp or timestamp <= self._last_seen_ts:
+            return
+        try:
+            changed_at = datetime.strptime(timestamp, CURSOR_FORMAT).replace(
+                tzinfo=timezone.utc
+            ).timestamp()
+        except ValueError:
+            return
+        if not self._change_times or changed_at - self._change_times[-1] >= POLL_MIN_DELAY:
+            self._change_times.append(changed_at)
             
-            self.connection.search(
+    def _next_poll_delay(self) -> float:
+        """
+        Wylicza opóźnienie kolejnego pollingu z rozkładu odstępów między zmianami.
+        
+        Histogram odstępów daje gęstość p(t) i dystrybuantę F(t). Dla czasu
+        L od ostatniej zmiany kolejny polling wypada w L + F(L) / p(L):
+        tuż po zmianie (seria zmian) pollujemy często, w ciszy - rzadko.
+        Pusty przedział histogramu bierze gęstość z najbliższego niepustego,
+        a cisza dłuższa niż najdłuższy odstęp daje back-off (opóźnienie = L).
+        
+        Returns:
+            Opóźnienie w sekundach, w przedziale [POLL_MIN_DELAY, POLL_MAX_DELAY]
+        """
+        times = self._change_times
+        if len(times) < 3:
+            return POLL_DEFAULT_DELAY
+            
+        intervals = [b - a for a, b in zip(times, itertools.islice(times, 1, None))]
+        width = max(intervals) / POLL_HISTOGRAM_BINS
+        counts = [0] * POLL_HISTOGRAM_BINS
+        for interval in intervals:
+            counts[min(int(interval / width), POLL_HISTOGRAM_BINS - 1)] += 1
+            
+        # Zegar IPA i poda mogą się nieco rozjeżdżać
+        elapsed = max(time.time() - times[-1], 0.0)
+        bin_index = int(elapsed / width)
+        if bin_index >= POLL_HISTOGRAM_BINS:
+            return min(max(elapsed, POLL_MIN_DELAY), POLL_MAX_DELAY)
+            
+        nearest = min(
+            (i for i, count in enumerate(counts) if count),
+            key=lambda i: abs(i - bin_index)
+        )
+        density = counts[nearest] / (len(intervals) * width)
+        cdf = (
+            sum(counts[:bin_index])
+            + counts[bin_index] * (elapsed - bin_index * width) / width
+        ) / len(intervals)
+        
+        return min(max(cdf / density, POLL_MIN_DELAY), POLL_MAX_DELAY)
+            
+    def _open_persistent_search(self):
+        """Otwiera persistent search na base_dn (osobne połączenie)."""
+        connection = Connection(
+            self._servers,
+            user=self.config.bind_dn,
+            password=self.config.bind_password,
+            auto_bind=True,
+            client_strategy=ASYNC_STREAM
+        )
+        try:
+            psearch = connection.extend.standard.persistent_search(
+                search_base=self.config.base_dn,
+                search_filter=_FILTER_PSEARCH,
+                attributes=[
+                    'objectClass', 'uid', 'mail', 'nsAccountLock', 'modifyTimestamp'
+                ],
+                changes_only=True,
+                show_deletions=False,
+                show_dn_modifications=False,
+                streaming=False
+            )
+        except Exception:
+            # Połączenie jest już zbindowane - nie zostawiaj go przy błędzie
+            connection.unbind()
+            raise
+            
+        self._psearch_connection = connection
+        return psearch
+        
+    async def _watch_persistent_search(self, psearch) -> bool:
+        """
+        Przetwarza zdarzenia persistent search aż do jego zakończenia.
+        
+        Najpierw wychodzą zdarzenia zakolejkowane w trakcie resyncu.
+        
+        Returns:
+            True po zerwaniu połączenia, False gdy serwer zakończył
+            wyszukiwanie (searchResDone, np. limit nsslapd-maxpsearch)
+            przy otwartym połączeniu
+        """
+        logger.info("Persistent search aktywny: %s", self.config.base_dn)
+        
+        while not self._psearch_connection.closed:
+            event = await asyncio.to_thread(
+                psearch.next, True, PSEARCH_CHECK_INTERVAL
+            )
+            if not event:
+                continue
+            if event.get('type') != 'searchResEntry':
+                # Bez tego provisioner czekałby w nieskończoność na zdarzenia,
+                # które już nie nadejdą (połączenie pozostaje otwarte)
+                logger.error(
+                    "Persistent search zakończony przez serwer: %s (%s)",
+                    event.get('result'), event.get('description')
+                )
+                return False
+            await self._dispatch_change(event)
+            
+        logger.warning("Persistent search przerwany, przejście na resync")
+        return True
+        
+    async def _dispatch_change(self, event: dict) -> None:
+        """
+        Kieruje zdarzenie persistent search do odpowiedniego handlera.
+        
+        Zdarzenia nie przesuwają kursora - nieudane zmiany obejmie
+        kolejny resync (kursor przesuwa tylko _process_changes).
+        """
+        object_classes = {
+            value.lower() for value in event['raw_attributes'].get('objectClass', ())
+        }
+        if b'organizationalunit' in object_classes:
+            # Nowa klasa - alias klasa-* od razu, nie dopiero po resyncu
+            if event.get('changeType') == 'add':
+                await self._update_group_aliases()
+        elif event.get('changeType') in ('add', 'modify'):
+            _, update = await self._handle_entry(event)
+            if update:
+                await self._update_mail_attributes([update])
+            self.mailbox_manager.flush_handled()
+            
+    async def _process_changes(self) -> None:
+        """
+        Znajduje nowych użytkowników w obserwowanych OU i dezaktywowanych
+        w całym base_dn (zablokowane konto bywa przenoszone poza obserwowane
+        OU, np. do ou=absolwenci).
+        
+        Wyszukiwania biegną równolegle, każde na własnym połączeniu z puli -
+        czas cyklu to max, nie suma. Filtry opierają się na indeksowanych
+        atrybutach (uid, mail, nsAccountLock - patrz
+        provisioner/ldap/mail-indexes.ldif).
+        
+        Przeszukiwane są tylko wpisy zmienione od ostatniego cyklu
+        (modifyTimestamp >= kursor), więc wynik to O(zmian), nie O(userów).
+        """
+        new_users = _changes_filter(self._last_seen_ts, _FILTER_NEW_USERS)
+        disabled_users = _changes_filter(self._last_seen_ts, _FILTER_DISABLED_USERS)
+        searches = [
+            (f"{ou},{self.config.base_dn}", new_users) for ou in self.config.watch_ous
+        ]
+        searches.append((self.config.base_dn, disabled_users))
+        
+        # Błąd jednego poddrzewa nie przerywa pozostałych (np. wyszukiwania
+        # dezaktywowanych w base_dn) - wstrzymuje tylko kursor
+        results = await asyncio.gather(
+            *(self._process_subtree(base, search_filter) for base, search_filter in searches),
+            return_exceptions=True
+        )
+        errors = [
+            (base, result) for (base, _), result in zip(searches, results)
+            if isinstance(result, BaseException)
+        ]
+        for base, error in errors:
+            logger.error("Błąd wyszukiwania zmian w %s: %s", base, error)
+        if errors:
+            return
+            
+        # Kursor przesuwany dopiero po przetworzeniu wszystkich wyszukiwań i nie
+        # dalej niż najstarszy nieudany wpis - kolejny resync go ponowi
+        last_seen_ts = max((last for last, _ in results), default="")
+        failed = [first for _, first in results if first]
+        self._advance_cursor(min(failed) if failed else last_seen_ts)
+        
+    async def _process_subtree(self, search_base: str, search_filter: str) -> tuple:
+        """
+        Przetwarza zmiany w jednym poddrzewie, strumieniowo stronami.
+        
+        Returns:
+            (najnowszy modifyTimestamp przetworzonych wpisów,
+            najstarszy modifyTimestamp wpisów nieudanych) - "" gdy brak
+        """
+        last_seen_ts = ""
+        first_failed_ts = ""
+        async with self._with_conn() as connection:
+            # aclosing - przy wyjątku generator kończy pobieranie, zanim
+            # połączenie wróci do puli
+            pages = self._paged_search(
+                connection,
                 search_base=search_base,
-                search_filter="(&(objectClass=person)(!(mail=*)))",
+                search_filter=search_filter,
                 search_scope=SUBTREE,
-                attributes=['uid', 'cn', 'givenName', 'sn']
+                attributes=['uid', 'mail', 'nsAccountLock', 'modifyTimestamp'],
+                paged_size=200
             )
             
-            for entry in self.connection.entries:
-                uid = entry.uid.value
-                role = self._detect_role(ou)
+            async with aclosing(pages):
+                async for entries in pages:
+                    # Wpisy strony równolegle (doveadm/rsync ograniczone semaforem)
+                    results = await asyncio.gather(
+                        *(self._handle_entry(e) for e in entries)
+                    )
+                    
+                    # Atrybuty mail całej strony zapisywane jednym pipeline'em
+                    failed_dns = await self._update_mail_attributes(
+                        [update for _, update in results if update]
+                    )
+                    self.mailbox_manager.flush_handled()
+                    
+                    for entry, (ok, _) in zip(entries, results):
+                        timestamp = _attribute_value(entry, 'modifyTimestamp') or ""
+                        last_seen_ts = max(last_seen_ts, timestamp)
+                        if not ok or entry['dn'] in failed_dns:
+                            first_failed_ts = min(first_failed_ts or timestamp, timestamp)
+                            
+        return last_seen_ts, first_failed_ts
+        
+    async def _paged_search(self, connection: Connection, **kwargs):
+        """
+        Strumieniuje wyniki paged_search stronami, bez materializacji całości.
+        
+        Generator ldap3 jest blokujący, więc strony pobierane są w wątku;
+        kolejna strona jest pobierana w trakcie przetwarzania bieżącej.
+        
+        Yields:
+            Listy wpisów (searchResEntry), najwyżej paged_size na stronę
+            
+        Raises:
+            LDAPOperationResult: Gdy serwer zakończył wyszukiwanie błędem
+            innym niż noSuchObject (generator ldap3 kończy się wtedy po cichu)
+        """
+        entries = connection.extend.standard.paged_search(generator=True, **kwargs)
+        page_size = kwargs['paged_size']
+        
+        def fetch_page() -> list:
+            return list(itertools.islice(entries, page_size))
+            
+        fetch = self._page_executor.submit(fetch_page)
+        try:
+            while True:
+                page = await asyncio.wrap_future(fetch)
+                if not page:
+                    result = connection.result
+                    # 32 = noSuchObject - brakujące OU to puste poddrzewo
+                    if result and result['result'] == 32:
+                        logger.warning(
+                            "Brak poddrzewa %s - pomijam", kwargs['search_base']
+                        )
+                    elif result and result['result'] != 0:
+                        raise LDAPOperationResult(
+                            result=result['result'],
+                            description=result['description'],
+                            dn=kwargs['search_base'],
+                            message=result['message'],
+                            response_type=result['type']
+                        )
+                    return
+                fetch = self._page_executor.submit(fetch_page)
+                yield [entry for entry in page if entry['type'] == 'searchResEntry']
+        finally:
+            # Wątku nie da się przerwać - połączenie może wrócić do puli
+            # dopiero po zakończeniu pobierania, także gdy konsument został
+            # anulowany (gather); shield + pętla czekają mimo anulowania
+            cancelled = False
+            while not fetch.done():
+                try:
+                    await asyncio.shield(asyncio.wrap_future(fetch))
+                except asyncio.CancelledError:
+                    cancelled = True
+                except Exception:
+                    break
+            if cancelled:
+                raise asyncio.CancelledError
+            
+    def _advance_cursor(self, timestamp: Optional[str]) -> None:
+        """Przesuwa kursor modifyTimestamp do przodu (nigdy wstecz)."""
+        if timestamp and timestamp > self._last_seen_ts:
+            self._last_seen_ts = timestamp
+            if self.state is not None:
+                self.state.save_cursor(timestamp)
                 
-                logger.info(f"Nowy użytkownik bez email: {uid} (rola: {role})")
+    async def _handle_entry(self, entry: dict) -> tuple:
+        """
+        Klasyfikuje wpis: nowy (aktywny, bez mail) lub dezaktywowany.
+        
+        Returns:
+            (ok, update) - ok=False gdy utworzenie lub archiwizacja skrzynki
+            się nie powiodły; update to (user_dn, email) do zapisania
+            w FreeIPA dla nowego użytkownika (lub None)
+        """
+        uid = _attribute_value(entry, 'uid')
+        if not uid:
+            return True, None
+            
+        mail = _attribute_value(entry, 'mail')
+        locked = (_attribute_value(entry, 'nsAccountLock') or "").upper() == "TRUE"
+        
+        if mail is None and not locked:
+            ou = self._watched_ou(entry['dn'])
+            if ou is not None:
+                self._record_change(_attribute_value(entry, 'modifyTimestamp'))
+                email = await self._on_user_add(uid, self._detect_role(ou))
+                if email is None:
+                    return False, None
+                return True, (entry['dn'], email)
+        elif mail is not None and locked:
+            self._record_change(_attribute_value(entry, 'modifyTimestamp'))
+            return await self._on_user_disable(uid), None
+        elif mail is not None:
+            # Aktywny z mail (tylko persistent search) - np. reaktywowany;
+            # jego kolejna dezaktywacja musi zarchiwizować skrzynkę ponownie
+            self.mailbox_manager.mark_active(uid)
+        return True, None
+            
+    async def _on_user_add(self, uid: str, role: UserRole) -> Optional[str]:
+        """Tworzy skrzynkę dla nowego użytkownika i zwraca jego adres email."""
+        logger.info("Nowy użytkownik bez email: %s (rola: %s)", uid, role)
+        
+        return await self.mailbox_manager.create_mailbox(uid, role)
+        
+    async def _on_user_disable(self, uid: str) -> bool:
+        """Archiwizuje skrzynkę dezaktywowanego użytkownika; True przy sukcesie."""
+        # Już zarchiwizowanych pomija MailboxManager (pamięć i baza stanu)
+        logger.info("Dezaktywowany użytkownik: %s", uid)
+        return await self.mailbox_manager.archive_mailbox(uid) is not None
+        
+    async def _update_group_aliases(self) -> None:
+        """
+        Tworzy brakujące aliasy grupowe dla klas (OU pod classes_ou).
+        
+        Alias to wpis groupOfURLs z memberURL wskazującym OU (np.
+        klasa-1ti-2026@zsel.opole.pl -> wszyscy aktywni z ou=1ti-2026).
+        Postfix rozwija memberURL przy dostarczaniu, więc członkostwo jest
+        zawsze aktualne - zapis do LDAP tylko przy pojawieniu się nowej klasy.
+        """
+        aliases_base = f"{self.config.aliases_ou},{self.config.base_dn}"
+        
+        async with self._with_conn() as connection:
+            search = connection.extend.standard.paged_search
+            if (
+                self._aliases is None
+                or time.monotonic() - self._aliases_loaded_at >= ALIASES_REFRESH_INTERVAL
+            ):
+                existing = await asyncio.to_thread(
+                    search, aliases_base, _FILTER_ALIASES, LEVEL,
+                    attributes=['cn'], generator=False
+                )
+                # 32 = noSuchObject - kontener nie jest tworzony automatycznie
+                if connection.result['result'] == 32:
+                    logger.error(
+                        "Brak kontenera aliasów %s - utwórz go "
+                        "(provisioner/ldap/mail-aliases.ldif)", aliases_base
+                    )
+                    return
+                self._aliases = {
+                    _attribute_value(entry, 'cn') for entry in existing
+                    if entry['type'] == 'searchResEntry'
+                }
+                self._aliases_loaded_at = time.monotonic()
                 
-                # Utwórz skrzynkę
-                email = await self.mailbox_manager.create_mailbox(uid, role)
+            classes = await asyncio.to_thread(
+                search, f"{self.config.classes_ou},{self.config.base_dn}",
+                _FILTER_CLASSES, LEVEL,
+                attributes=['ou'], generator=False
+            )
+            
+        # cn aliasu -> DN OU klasy
+        wanted = {
+            f"klasa-{_attribute_value(entry, 'ou').lower()}": entry['dn']
+            for entry in classes if entry['type'] == 'searchResEntry'
+        }
                 
-                # Zaktualizuj atrybut mail w FreeIPA
-                await self._update_mail_attribute(entry.entry_dn, email)
+        missing = {cn: dn for cn, dn in wanted.items() if cn not in self._aliases}
+        if not missing:
+            return
+            
+        results = await self._pipeline([
+            ('add', (
+                f"cn={cn},{aliases_base}",
+                ['top', 'groupOfURLs'],
+                {
+                    'cn': cn,
+                    'memberURL': f"ldap:///{dn}??sub?{_FILTER_ALIAS_MEMBERS}"
+                }
+            ))
+            for cn, dn in missing.items()
+        ])
+        
+        for cn, result in zip(missing, results):
+            # 68 = entryAlreadyExists (np. utworzony ręcznie w międzyczasie)
+            if result['result'] in (0, 68):
+                self._aliases.add(cn)
+                logger.info("Utworzono alias grupowy: %s", cn)
+            else:
+                logger.error("Błąd tworzenia aliasu %s: %s", cn, result['description'])
+                # Pamięć aliasów mogła się rozjechać z katalogiem - odczyt od nowa
+                self._aliases = None
                 
-    async def _process_disabled_users(self) -> None:
-        """Znajduje i przetwarza dezaktywowanych użytkowników."""
-        search_base = self.config.base_dn
-        
-        # Szukaj użytkowników z nsAccountLock=TRUE
-        self.connection.search(
-            search_base=search_base,
-            search_filter="(&(objectClass=person)(nsAccountLock=TRUE)(mail=*))",
-            search_scope=SUBTREE,
-            attributes=['uid', 'mail', 'nsAccountLock']
-        )
+    async def _pipeline(self, operations: list) -> list:
+        """
+        Wysyła operacje zapisu połączeniem ASYNC i zbiera wyniki.
         
-        for entry in self.connection.entries:
-            uid = entry.uid.value
+        Wszystkie operacje są wysyłane bez czekania na odpowiedź, a
+        odpowiedzi zbierane na końcu - N zapisów kosztuje ~1 RTT.
+        
+        Args:
+            operations: Lista par (metoda Connection, argumenty),
+                np. ('modify', (dn, changes))
+                
+        Returns:
+            Wyniki LDAP (słowniki result) w kolejności operacji
+        """
+        async with self._writer_lock:
+            # ASYNC nie wznawia połączenia sam - ponowny bind po zerwaniu
+            if self._writer.closed:
+                await asyncio.to_thread(self._writer.bind)
+                
+            message_ids = [
+                getattr(self._writer, method)(*args) for method, args in operations
+            ]
+            responses = await asyncio.to_thread(
+                lambda: [self._writer.get_response(m) for m in message_ids]
+            )
             
-            # Sprawdź czy już zarchiwizowany (marker)
-            # TODO: Sprawdź w bazie archiwum
+        return [result for _, result in responses]
+        
+    async def _update_mail_attributes(self, updates: list) -> set:
+        """
+        Aktualizuje atrybut mail wielu użytkowników w FreeIPA (jeden pipeline).
+        
+        Args:
+            updates: Lista par (user_dn, email)
             
-            logger.info(f"Dezaktywowany użytkownik: {uid}")
-            await self.mailbox_manager.archive_mailbox(uid)
+        Returns:
+            DN-y, których zapis się nie powiódł
+        """
+        failed = set()
+        if not updates:
+            return failed
             
-    async def _update_group_aliases(self) -> None:
-        """Aktualizuje aliasy grupowe na podstawie OU."""
-        # Dla każdej klasy utwórz alias
-        # np. klasa-1ti-2026@zsel.opole.pl -> wszyscy z ou=1ti-2026
+        results = await self._pipeline([
+            ('modify', (user_dn, {'mail': [(MODIFY_REPLACE, [email])]}))
+            for user_dn, email in updates
+        ])
         
-        # TODO: Implementacja
-        pass
+        for (user_dn, email), result in zip(updates, results):
+            if result['result'] == 0:
+                logger.info("Zaktualizowano mail dla %s: %s", user_dn, email)
+            else:
+                failed.add(user_dn)
+                logger.error(
+                    "Błąd aktualizacji mail dla %s: %s", user_dn, result['description']
+                )
+        return failed
         
-    async def _update_mail_attribute(self, user_dn: str, email: str) -> None:
-        """Aktualizuje atrybut mail użytkownika w FreeIPA."""
-        self.connection.modify(
-            user_dn,
-            {'mail': [(MODIFY_REPLACE, [email])]}
-        )
-        logger.info(f"Zaktualizowano mail dla {user_dn}: {email}")
+    def _watched_ou(self, dn: str) -> Optional[str]:
+        """Zwraca obserwowane OU, do którego należy wpis (lub None)."""
+        dn = dn.lower()
+        for ou in self.config.watch_ous:
+            if dn.endswith(f",{ou},{self.config.base_dn}".lower()):
+                return ou
+        return None
         
     def _detect_role(self, ou: str) -> UserRole:
         """Wykrywa rolę na podstawie OU."""
-        if "uczniowie" in ou:
-            return UserRole.UCZEN
-        elif "nauczyciele" in ou:
-            return UserRole.NAUCZYCIEL
-        elif "administracja" in ou:
-            return UserRole.ADMINISTRACJA
-        elif "dyrekcja" in ou:
-            return UserRole.DYREKCJA
-        return UserRole.UCZEN
+        return _role_for_ou(ou)
 
 
 async def main():
     """Główna funkcja uruchamiająca provisioner."""
-    import os
-    
     freeipa_config = FreeIPAConfig(
         bind_password=os.environ.get("FREEIPA_PASSWORD", "")
     )
-    mail_config = MailConfig()
+    mail_config = MailConfig(
+        archive_base=os.environ.get("ARCHIVE_PATH", DEFAULT_ARCHIVE_PATH),
+        doveadm_url=os.environ.get("DOVEADM_URL", DEFAULT_DOVEADM_URL),
+        doveadm_api_key=os.environ.get("DOVEADM_API_KEY", "")
+    )
+    state = ProvisionerState(os.environ.get("STATE_PATH", DEFAULT_STATE_PATH))
     
-    mailbox_manager = MailboxManager(mail_config)
-    listener = FreeIPAListener(freeipa_config, mailbox_manager)
+    mailbox_manager = MailboxManager(mail_config, state)
+    listener = FreeIPAListener(freeipa_config, mailbox_manager, state)
     
     logger.info("Uruchamianie ZSEL Mail Provisioner...")
     await listener.watch_users()
 
 
 if __name__ == "__main__":
+    if uvloop is not None:
+        uvloop.install()
     asyncio.run(main())
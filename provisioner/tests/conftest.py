@@ -0,0 +1,21 @@
+"""Wspólna konfiguracja testów provisionera."""
+
+import os
+import sys
+
+import pytest
+
+# Testy importują moduł jako src.main (jak `python -m src.main` w obrazie)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src import main  # noqa: E402
+from fakes import FakeClock  # noqa: E402
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Zegar (time.monotonic i time.time) sterowany z testu."""
+    fake = FakeClock()
+    monkeypatch.setattr(main.time, "monotonic", fake)
+    monkeypatch.setattr(main.time, "time", fake)
+    return fake
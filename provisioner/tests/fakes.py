@@ -0,0 +1,97 @@
+"""Atrapy LDAP i MailboxManagera dla testów - bez serwera LDAP i Dovecota."""
+
+import asyncio
+
+from src.main import FreeIPAConfig, FreeIPAListener
+
+
+class FakeClock:
+    """Podmiana time.monotonic/time.time sterowana z testu."""
+    
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+        
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeMailboxManager:
+    """Zapisuje wywołania zamiast uruchamiać doveadm/rsync."""
+    
+    def __init__(self, create_ok: bool = True, archive_ok: bool = True):
+        self.create_ok = create_ok
+        self.archive_ok = archive_ok
+        self.calls = []
+        self.flushes = 0
+        
+    async def create_mailbox(self, uid, role):
+        self.calls.append(("create", uid, role))
+        return f"{uid}@zsel.opole.pl" if self.create_ok else None
+        
+    async def archive_mailbox(self, uid):
+        self.calls.append(("archive", uid))
+        return f"/archive/mail/{uid}" if self.archive_ok else None
+        
+    def mark_active(self, uid):
+        self.calls.append(("active", uid))
+        
+    def flush_handled(self):
+        self.flushes += 1
+
+
+def entry(dn: str, **attributes) -> dict:
+    """Wpis w formacie odpowiedzi ldap3 (raw_attributes)."""
+    return {
+        'dn': dn,
+        'type': 'searchResEntry',
+        'raw_attributes': {
+            name: [value.encode()] for name, value in attributes.items()
+        },
+    }
+
+
+def listener(mailbox_manager=None, **config) -> FreeIPAListener:
+    """FreeIPAListener bez połączeń (connect() nie jest wywoływane)."""
+    return FreeIPAListener(
+        FreeIPAConfig(**config), mailbox_manager or FakeMailboxManager()
+    )
+
+
+class FakeLDAPConnection:
+    """
+    Połączenie ldap3 dla paged_search: wpisy i kod wyniku per search_base.
+    
+    subtrees: {search_base: (lista wpisów, kod wyniku LDAP)}; brakująca
+    baza daje noSuchObject (32), jak 389-DS dla nieistniejącego OU.
+    """
+    
+    def __init__(self, subtrees: dict):
+        self.subtrees = subtrees
+        self.result = None
+        self.searches = []
+        self.extend = self
+        self.standard = self
+        
+    def paged_search(self, search_base, search_filter, search_scope=None,
+                     generator=True, **kwargs):
+        self.searches.append((search_base, search_filter))
+        entries, code = self.subtrees.get(search_base, ([], 32))
+        self.result = {
+            'result': code, 'description': f"kod {code}", 'message': '',
+            'type': 'searchResDone',
+        }
+        return iter(entries) if generator else list(entries)
+
+
+def pooled_listener(subtrees: dict, mailbox_manager=None, **config) -> FreeIPAListener:
+    """FreeIPAListener z pulą atrap połączeń i zapisem mail zawsze udanym."""
+    watcher = listener(mailbox_manager, **config)
+    watcher._pool = asyncio.Queue()
+    for _ in range(watcher.config.pool_size):
+        watcher._pool.put_nowait(FakeLDAPConnection(subtrees))
+        
+    async def pipeline(operations):
+        return [{'result': 0, 'description': 'success'} for _ in operations]
+        
+    watcher._pipeline = pipeline
+    return watcher
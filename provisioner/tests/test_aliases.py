@@ -0,0 +1,119 @@
+"""Testy aliasów grupowych klas (groupOfURLs pod ou=aliases)."""
+
+import asyncio
+
+from fakes import entry, pooled_listener
+from src import main
+
+BASE = "dc=zsel,dc=opole,dc=pl"
+ALIASES = f"ou=aliases,{BASE}"
+CLASSES = f"ou=uczniowie,{BASE}"
+
+
+def _class(ou):
+    entry_ = entry(f"ou={ou},{CLASSES}", ou=ou)
+    entry_['raw_attributes']['objectClass'] = [b'organizationalUnit']
+    return entry_
+
+
+def _alias(cn):
+    return entry(f"cn={cn},{ALIASES}", cn=cn)
+
+
+def _recording_listener(subtrees, codes=None):
+    """Listener zapisujący operacje pipeline; codes: {cn: kod wyniku}."""
+    watcher = pooled_listener(subtrees)
+    watcher.added = []
+    
+    async def pipeline(operations):
+        results = []
+        for method, (dn, object_classes, attributes) in operations:
+            watcher.added.append((method, dn, attributes))
+            code = (codes or {}).get(attributes['cn'], 0)
+            results.append({'result': code, 'description': f"kod {code}"})
+        return results
+    
+    watcher._pipeline = pipeline
+    return watcher
+
+
+def test_missing_aliases_container_skips_creation():
+    watcher = _recording_listener({CLASSES: ([_class("1TI-2026")], 0)})
+    
+    asyncio.run(watcher._update_group_aliases())
+    
+    assert watcher.added == []
+    assert watcher._aliases is None
+
+
+def test_only_missing_class_aliases_are_created():
+    watcher = _recording_listener({
+        ALIASES: ([_alias("klasa-1ti-2026")], 0),
+        CLASSES: ([_class("1TI-2026"), _class("2TE-2025")], 0),
+    })
+    
+    asyncio.run(watcher._update_group_aliases())
+    
+    dn = f"ou=2TE-2025,{CLASSES}"
+    assert watcher.added == [(
+        'add', f"cn=klasa-2te-2025,{ALIASES}",
+        {
+            'cn': "klasa-2te-2025",
+            'memberURL': f"ldap:///{dn}??sub?{main._FILTER_ALIAS_MEMBERS}",
+        },
+    )]
+    assert watcher._aliases == {"klasa-1ti-2026", "klasa-2te-2025"}
+
+
+def test_already_existing_alias_is_cached():
+    watcher = _recording_listener(
+        {ALIASES: ([], 0), CLASSES: ([_class("1TI-2026")], 0)},
+        codes={"klasa-1ti-2026": 68},
+    )
+    
+    asyncio.run(watcher._update_group_aliases())
+    asyncio.run(watcher._update_group_aliases())
+    
+    assert len(watcher.added) == 1
+    assert watcher._aliases == {"klasa-1ti-2026"}
+
+
+def test_failed_add_invalidates_alias_cache():
+    watcher = _recording_listener(
+        {ALIASES: ([], 0), CLASSES: ([_class("1TI-2026")], 0)},
+        codes={"klasa-1ti-2026": 50},
+    )
+    
+    asyncio.run(watcher._update_group_aliases())
+    
+    assert watcher._aliases is None
+
+
+def test_alias_deleted_by_hand_is_recreated_after_refresh(clock):
+    subtrees = {
+        ALIASES: ([_alias("klasa-1ti-2026")], 0),
+        CLASSES: ([_class("1TI-2026")], 0),
+    }
+    watcher = _recording_listener(subtrees)
+    asyncio.run(watcher._update_group_aliases())
+    subtrees[ALIASES] = ([], 0)
+    
+    clock.now += main.ALIASES_REFRESH_INTERVAL - 1
+    asyncio.run(watcher._update_group_aliases())
+    assert watcher.added == []
+    
+    clock.now += 1
+    asyncio.run(watcher._update_group_aliases())
+    assert [dn for _, dn, _ in watcher.added] == [f"cn=klasa-1ti-2026,{ALIASES}"]
+
+
+def test_new_class_ou_event_creates_alias():
+    watcher = _recording_listener({
+        ALIASES: ([], 0),
+        CLASSES: ([_class("3TI-2024")], 0),
+    })
+    event = dict(_class("3TI-2024"), changeType='add')
+    
+    asyncio.run(watcher._dispatch_change(event))
+    
+    assert [dn for _, dn, _ in watcher.added] == [f"cn=klasa-3ti-2024,{ALIASES}"]
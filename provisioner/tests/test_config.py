@@ -0,0 +1,21 @@
+"""Testy konfiguracji (niemutowalne dataclassy)."""
+
+import dataclasses
+
+import pytest
+
+from src.main import FreeIPAConfig, MailConfig
+
+
+@pytest.mark.parametrize("config, field", [
+    (MailConfig(), "domain"),
+    (FreeIPAConfig(), "server"),
+])
+def test_configs_are_frozen(config, field):
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        setattr(config, field, "example.com")
+
+
+def test_configs_have_no_instance_dict():
+    assert not hasattr(MailConfig(), "__dict__")
+    assert not hasattr(FreeIPAConfig(), "__dict__")
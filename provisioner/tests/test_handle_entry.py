@@ -0,0 +1,80 @@
+"""Testy klasyfikacji wpisów (nowy / dezaktywowany / aktywny z mail)."""
+
+import asyncio
+
+import pytest
+
+from fakes import FakeMailboxManager, entry, listener
+from src.main import UserRole
+
+BASE = "dc=zsel,dc=opole,dc=pl"
+
+
+def test_new_user_in_watched_ou():
+    manager = FakeMailboxManager()
+    dn = f"uid=jkowalski,ou=1ti-2026,ou=uczniowie,{BASE}"
+    
+    result = asyncio.run(listener(manager)._handle_entry(entry(dn, uid="jkowalski")))
+    
+    assert result == (True, (dn, "jkowalski@zsel.opole.pl"))
+    assert manager.calls == [("create", "jkowalski", UserRole.UCZEN)]
+
+
+def test_failed_create_gives_no_update():
+    manager = FakeMailboxManager(create_ok=False)
+    dn = f"uid=anowak,ou=nauczyciele,{BASE}"
+    
+    result = asyncio.run(listener(manager)._handle_entry(entry(dn, uid="anowak")))
+    
+    assert result == (False, None)
+    assert manager.calls == [("create", "anowak", UserRole.NAUCZYCIEL)]
+
+
+def test_new_user_outside_watched_ou():
+    manager = FakeMailboxManager()
+    dn = f"uid=gosc,ou=inne,{BASE}"
+    
+    result = asyncio.run(listener(manager)._handle_entry(entry(dn, uid="gosc")))
+    
+    assert result == (True, None)
+    assert manager.calls == []
+
+
+@pytest.mark.parametrize("archive_ok", [True, False])
+def test_disabled_user(archive_ok):
+    manager = FakeMailboxManager(archive_ok=archive_ok)
+    disabled = entry(
+        f"uid=absolwent,ou=absolwenci,{BASE}",
+        uid="absolwent", mail="absolwent@zsel.opole.pl", nsAccountLock="TRUE"
+    )
+    
+    result = asyncio.run(listener(manager)._handle_entry(disabled))
+    
+    assert result == (archive_ok, None)
+    assert manager.calls == [("archive", "absolwent")]
+
+
+def test_locked_user_without_mail_is_ignored():
+    manager = FakeMailboxManager()
+    locked = entry(f"uid=nowy,ou=uczniowie,{BASE}", uid="nowy", nsAccountLock="true")
+    
+    assert asyncio.run(listener(manager)._handle_entry(locked)) == (True, None)
+    assert manager.calls == []
+
+
+def test_active_user_with_mail():
+    manager = FakeMailboxManager()
+    active = entry(
+        f"uid=jkowalski,ou=uczniowie,{BASE}",
+        uid="jkowalski", mail="jkowalski@zsel.opole.pl"
+    )
+    
+    result = asyncio.run(listener(manager)._handle_entry(active))
+    
+    assert result == (True, None)
+    assert manager.calls == [("active", "jkowalski")]
+
+
+def test_entry_without_uid():
+    result = asyncio.run(listener()._handle_entry(entry(f"cn=grupa,{BASE}")))
+    assert result == (True, None)
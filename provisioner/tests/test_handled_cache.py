@@ -0,0 +1,50 @@
+"""Testy pamięci obsłużonych użytkowników (_TTLSet, pomijanie powtórek)."""
+
+import asyncio
+
+from src.main import MailboxManager, MailConfig, UserRole, _TTLSet
+
+
+def test_ttl_set_expires(clock):
+    items = _TTLSet(ttl=10, maxsize=100)
+    items.add("jkowalski")
+    assert "jkowalski" in items
+    
+    clock.now += 10
+    assert "jkowalski" not in items
+
+
+def test_ttl_set_discard():
+    items = _TTLSet(ttl=10, maxsize=100)
+    items.add("jkowalski")
+    items.discard("jkowalski")
+    items.discard("brak")
+    assert "jkowalski" not in items
+
+
+def test_ttl_set_evicts_oldest(clock):
+    items = _TTLSet(ttl=100, maxsize=2)
+    items.add("a")
+    items.add("b")
+    items.add("a")  # odświeżenie - "b" jest teraz najstarszy
+    items.add("c")
+    assert "a" in items
+    assert "b" not in items
+    assert "c" in items
+
+
+def test_handled_users_skip_mailbox_work(monkeypatch):
+    manager = MailboxManager(MailConfig())
+    
+    async def unexpected(*args, **kwargs):
+        raise AssertionError("powtórne wywołanie doveadm/rsync")
+        
+    monkeypatch.setattr(manager, "_doveadm", unexpected)
+    monkeypatch.setattr(manager, "_run", unexpected)
+    manager._provisioned.add("jkowalski")
+    manager._archived.add("absolwent")
+    
+    assert asyncio.run(
+        manager.create_mailbox("jkowalski", UserRole.UCZEN)
+    ) == "jkowalski@zsel.opole.pl"
+    assert asyncio.run(manager.archive_mailbox("absolwent")) == "/archive/mail/absolwent"
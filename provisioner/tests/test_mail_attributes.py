@@ -0,0 +1,76 @@
+"""Testy zapisu atrybutów mail pipeline'em ASYNC."""
+
+import asyncio
+
+from ldap3 import MODIFY_REPLACE
+
+from fakes import listener
+
+BASE = "dc=zsel,dc=opole,dc=pl"
+
+
+class FakeWriter:
+    """Połączenie ASYNC: modify zwraca message id, get_response wynik."""
+    
+    def __init__(self, failing=(), closed=False):
+        self.failing = set(failing)
+        self.closed = closed
+        self.bound = False
+        self.sent = []
+        
+    def bind(self):
+        self.bound = True
+        self.closed = False
+        
+    def modify(self, dn, changes):
+        self.sent.append((dn, changes))
+        return len(self.sent)
+        
+    def get_response(self, message_id):
+        dn, _ = self.sent[message_id - 1]
+        if dn in self.failing:
+            return None, {'result': 50, 'description': 'insufficientAccessRights'}
+        return None, {'result': 0, 'description': 'success'}
+
+
+def _update(writer, updates):
+    watcher = listener()
+    watcher._writer = writer
+    return asyncio.run(watcher._update_mail_attributes(updates))
+
+
+def test_all_updates_sent_in_one_pipeline():
+    writer = FakeWriter()
+    updates = [
+        (f"uid=a,ou=uczniowie,{BASE}", "a@zsel.opole.pl"),
+        (f"uid=b,ou=uczniowie,{BASE}", "b@zsel.opole.pl"),
+    ]
+    
+    assert _update(writer, updates) == set()
+    assert writer.sent == [
+        (dn, {'mail': [(MODIFY_REPLACE, [email])]}) for dn, email in updates
+    ]
+
+
+def test_failed_dns_are_reported():
+    failing = f"uid=b,ou=uczniowie,{BASE}"
+    writer = FakeWriter(failing=[failing])
+    
+    failed = _update(writer, [
+        (f"uid=a,ou=uczniowie,{BASE}", "a@zsel.opole.pl"),
+        (failing, "b@zsel.opole.pl"),
+    ])
+    
+    assert failed == {failing}
+
+
+def test_no_updates_sends_nothing():
+    writer = FakeWriter()
+    assert _update(writer, []) == set()
+    assert writer.sent == []
+
+
+def test_closed_writer_is_rebound():
+    writer = FakeWriter(closed=True)
+    _update(writer, [(f"uid=a,ou=uczniowie,{BASE}", "a@zsel.opole.pl")])
+    assert writer.bound
@@ -0,0 +1,157 @@
+"""Testy MailboxManagera: doveadm HTTP API, rsync i ścieżki błędów."""
+
+import asyncio
+import json
+
+import pytest
+
+from src import main
+from src.main import MailboxManager, MailConfig, ProvisionerState, UserRole
+
+
+class FakeDoveadm:
+    """Odpowiedzi doveadm HTTP API per komenda (lista lub wyjątek)."""
+    
+    def __init__(self, **responses):
+        self.responses = responses
+        self.requests = []
+        
+    def __call__(self, request):
+        (command, parameters, _), = json.loads(request.data)
+        self.requests.append((command, parameters))
+        response = self.responses[command]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def _ok(rows=()):
+    return [["doveadmResponse", list(rows), "provisioner"]]
+
+
+def _error(exit_code):
+    return [["error", {"type": "exitCode", "exitCode": exit_code}, "provisioner"]]
+
+
+@pytest.fixture
+def state():
+    return ProvisionerState(":memory:")
+
+
+def _manager(monkeypatch, state, doveadm=None, **config) -> MailboxManager:
+    manager = MailboxManager(MailConfig(doveadm_api_key="klucz", **config), state)
+    if doveadm is not None:
+        monkeypatch.setattr(manager, "_http_call", doveadm)
+    return manager
+
+
+def _create(manager):
+    return asyncio.run(manager.create_mailbox("jkowalski", UserRole.UCZEN))
+
+
+def test_create_makes_only_missing_folders(monkeypatch, state):
+    doveadm = FakeDoveadm(
+        mailboxList=_ok([{"mailbox": "INBOX"}, {"mailbox": "Sent"}]),
+        mailboxCreate=_ok()
+    )
+    manager = _manager(monkeypatch, state, doveadm)
+    
+    assert _create(manager) == "jkowalski@zsel.opole.pl"
+    manager.flush_handled()
+    assert doveadm.requests[1] == ("mailboxCreate", {
+        "user": "jkowalski@zsel.opole.pl",
+        "mailbox": ["Drafts", "Trash", "Junk"],
+        "subscriptions": True,
+    })
+    assert state.is_handled("jkowalski", "provisioned")
+
+
+def test_create_with_all_folders_present_is_success(monkeypatch, state):
+    doveadm = FakeDoveadm(mailboxList=_ok(
+        [{"mailbox": folder} for folder in ("INBOX", *main.DEFAULT_FOLDERS)]
+    ))
+    manager = _manager(monkeypatch, state, doveadm)
+    
+    assert _create(manager) == "jkowalski@zsel.opole.pl"
+    assert [command for command, _ in doveadm.requests] == ["mailboxList"]
+
+
+@pytest.mark.parametrize("doveadm", [
+    FakeDoveadm(mailboxList=_ok(), mailboxCreate=_error(65)),
+    FakeDoveadm(mailboxList=_ok(), mailboxCreate=_error(73)),
+    FakeDoveadm(mailboxList=_error(67)),
+    FakeDoveadm(mailboxList=ConnectionRefusedError("refused")),
+    FakeDoveadm(mailboxList=[]),
+    FakeDoveadm(mailboxList=[["doveadmResponse"]]),
+])
+def test_create_failure_returns_none(monkeypatch, state, doveadm):
+    manager = _manager(monkeypatch, state, doveadm)
+    
+    assert _create(manager) is None
+    manager.flush_handled()
+    assert "jkowalski" not in manager._provisioned
+    assert not state.is_handled("jkowalski", "provisioned")
+
+
+def test_doveadm_request_is_authorized(monkeypatch, state):
+    doveadm = FakeDoveadm(mailboxList=_ok())
+    requests = []
+    
+    def capture(request):
+        requests.append(request)
+        return doveadm(request)
+        
+    manager = _manager(monkeypatch, state, capture)
+    asyncio.run(manager._doveadm("mailboxList", user="jkowalski@zsel.opole.pl"))
+    
+    # base64("klucz")
+    assert requests[0].get_header("Authorization") == "X-Dovecot-API a2x1Y3o="
+    assert requests[0].full_url == main.DEFAULT_DOVEADM_URL
+
+
+def test_archive_requires_mounted_archive(monkeypatch, state):
+    manager = _manager(monkeypatch, state)
+    monkeypatch.setattr(main.os.path, "ismount", lambda path: False)
+    
+    async def unexpected(*argv):
+        raise AssertionError("rsync bez zamontowanego archiwum")
+        
+    monkeypatch.setattr(manager, "_run", unexpected)
+    
+    assert asyncio.run(manager.archive_mailbox("absolwent")) is None
+
+
+@pytest.mark.parametrize("copied", [True, False])
+def test_archive_marks_only_successful_copy(monkeypatch, state, copied):
+    manager = _manager(monkeypatch, state, archive_base="/archiwum")
+    monkeypatch.setattr(main.os.path, "ismount", lambda path: True)
+    state.update_handled([("absolwent", "provisioned")], [])
+    calls = []
+    
+    async def run(*argv):
+        calls.append(argv)
+        return copied
+        
+    monkeypatch.setattr(manager, "_run", run)
+    
+    result = asyncio.run(manager.archive_mailbox("absolwent"))
+    manager.flush_handled()
+    
+    assert calls == [(
+        "rsync", "-a", "--fsync",
+        "/var/mail/vhosts/zsel.opole.pl/absolwent/", "/archiwum/absolwent/"
+    )]
+    assert result == ("/archiwum/absolwent" if copied else None)
+    assert state.is_handled("absolwent", "archived") is copied
+    assert state.is_handled("absolwent", "provisioned") is not copied
+
+
+def test_run_reports_missing_binary():
+    manager = MailboxManager(MailConfig())
+    assert asyncio.run(manager._run("brak-takiego-polecenia-zsel")) is False
+
+
+def test_run_reports_non_zero_exit():
+    manager = MailboxManager(MailConfig())
+    assert asyncio.run(manager._run("false")) is False
+    assert asyncio.run(manager._run("true")) is True
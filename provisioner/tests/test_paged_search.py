@@ -0,0 +1,114 @@
+"""Testy strumieniowania paged_search (strony, zamykanie, błędy)."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from ldap3.core.exceptions import LDAPSizeLimitExceededResult
+
+from fakes import entry, listener
+
+BASE = "dc=zsel,dc=opole,dc=pl"
+
+
+class FakeStandard:
+    def __init__(self, connection):
+        self._connection = connection
+        
+    def paged_search(self, generator=True, **kwargs):
+        return self._connection.generate()
+
+
+class FakeExtend:
+    def __init__(self, connection):
+        self.standard = FakeStandard(connection)
+
+
+class FakeConnection:
+    """Połączenie ldap3 zwracające entries; druga i kolejne pozycje po delay."""
+    
+    def __init__(self, entries, delay=0.0, result=None):
+        self.entries = entries
+        self.delay = delay
+        self.result = result or {
+            'result': 0, 'description': 'success', 'message': '', 'type': 'searchResDone'
+        }
+        self.fetching = threading.Event()
+        self.extend = FakeExtend(self)
+        
+    def generate(self):
+        for index, item in enumerate(self.entries):
+            if index:
+                self.fetching.set()
+                time.sleep(self.delay)
+                self.fetching.clear()
+            yield item
+
+
+class RecordingPool(asyncio.Queue):
+    """Pula zapamiętująca, czy wątek pobierający działał przy zwrocie połączenia."""
+    
+    def __init__(self, connection):
+        super().__init__()
+        self.released_while_fetching = []
+        super().put_nowait(connection)
+        
+    def put_nowait(self, connection):
+        self.released_while_fetching.append(connection.fetching.is_set())
+        super().put_nowait(connection)
+
+
+def _users(count):
+    return [entry(f"cn=wpis{i},{BASE}") for i in range(count)]
+
+
+async def _collect(watcher, connection, paged_size):
+    pages = []
+    async for page in watcher._paged_search(
+        connection, search_base=BASE, search_filter="(uid=*)", paged_size=paged_size
+    ):
+        pages.append(page)
+    return pages
+
+
+def test_pages_are_streamed_in_order():
+    connection = FakeConnection(_users(5))
+    pages = asyncio.run(_collect(listener(), connection, paged_size=2))
+    assert [len(page) for page in pages] == [2, 2, 1]
+
+
+def test_cancelled_consumer_keeps_connection_until_fetch_ends():
+    watcher = listener(pool_size=1)
+    connection = FakeConnection(_users(2), delay=0.3)
+    watcher._pool = RecordingPool(connection)
+    
+    async def failing_sibling():
+        await asyncio.sleep(0.05)
+        raise ValueError("błąd innego wyszukiwania")
+        
+    async def run():
+        async with asyncio.TaskGroup() as group:
+            group.create_task(watcher._process_subtree(BASE, "(uid=*)"))
+            group.create_task(failing_sibling())
+            
+    with pytest.raises(ExceptionGroup):
+        asyncio.run(run())
+        
+    assert watcher._pool.released_while_fetching == [False]
+
+
+def test_missing_subtree_is_empty():
+    connection = FakeConnection([], result={
+        'result': 32, 'description': 'noSuchObject', 'message': '', 'type': 'searchResDone'
+    })
+    assert asyncio.run(_collect(listener(), connection, paged_size=2)) == []
+
+
+def test_server_error_is_raised():
+    connection = FakeConnection(_users(1), result={
+        'result': 4, 'description': 'sizeLimitExceeded', 'message': '',
+        'type': 'searchResDone'
+    })
+    with pytest.raises(LDAPSizeLimitExceededResult):
+        asyncio.run(_collect(listener(), connection, paged_size=2))
@@ -0,0 +1,64 @@
+"""Testy obsługi zdarzeń persistent search."""
+
+import asyncio
+
+from fakes import FakeMailboxManager, entry, listener
+
+BASE = "dc=zsel,dc=opole,dc=pl"
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+
+class FakePersistentSearch:
+    """Kolejka zdarzeń jak PersistentSearch.next (None = timeout)."""
+    
+    def __init__(self, connection, events):
+        self._connection = connection
+        self._events = list(events)
+        
+    def next(self, block=False, timeout=None):
+        if not self._events:
+            self._connection.closed = True
+            return None
+        return self._events.pop(0)
+
+
+def _watch(events, manager=None):
+    watcher = listener(manager)
+    watcher._psearch_connection = FakeConnection()
+    
+    async def pipeline(operations):
+        return [{'result': 0, 'description': 'success'} for _ in operations]
+        
+    watcher._pipeline = pipeline
+    psearch = FakePersistentSearch(watcher._psearch_connection, events)
+    return asyncio.run(watcher._watch_persistent_search(psearch)), watcher
+
+
+def test_entries_are_dispatched_until_connection_drops():
+    manager = FakeMailboxManager()
+    dn = f"uid=jkowalski,ou=uczniowie,{BASE}"
+    added = dict(entry(dn, uid="jkowalski"), changeType='add')
+    
+    dropped, watcher = _watch([None, added], manager)
+    
+    assert dropped is True
+    assert manager.calls[0][:2] == ("create", "jkowalski")
+
+
+def test_search_done_ends_watch_with_open_connection():
+    manager = FakeMailboxManager()
+    done = {
+        'type': 'searchResDone', 'result': 53,
+        'description': 'unwillingToPerform', 'dn': '', 'message': ''
+    }
+    later = dict(entry(f"uid=x,ou=uczniowie,{BASE}", uid="x"), changeType='add')
+    
+    dropped, watcher = _watch([done, later], manager)
+    
+    assert dropped is False
+    assert not watcher._psearch_connection.closed
+    assert manager.calls == []
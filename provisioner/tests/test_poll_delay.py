@@ -0,0 +1,88 @@
+"""Testy adaptacyjnego opóźnienia pollingu."""
+
+import asyncio
+from datetime import datetime, timezone
+
+from fakes import entry, listener
+from src import main
+
+BASE = "dc=zsel,dc=opole,dc=pl"
+
+
+def _with_changes(watcher, clock, offsets):
+    """Ustawia historię zmian: offsets to momenty zmian względem teraz."""
+    watcher._change_times.clear()
+    watcher._change_times.extend(clock.now + offset for offset in offsets)
+
+
+def _generalized(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime(main.CURSOR_FORMAT)
+
+
+def test_default_without_history(clock):
+    watcher = listener()
+    _with_changes(watcher, clock, [-20, -10])
+    assert watcher._next_poll_delay() == main.POLL_DEFAULT_DELAY
+
+
+def test_short_delay_after_burst(clock):
+    watcher = listener()
+    _with_changes(watcher, clock, [-41, -31, -21, -11, -1])
+    assert watcher._next_poll_delay() == main.POLL_MIN_DELAY
+
+
+def test_empty_bin_uses_nearest_bin(clock):
+    watcher = listener()
+    # Odstępy 10, 10, 80, 10 (przedziały po 5 s); 55 s ciszy to pusty
+    # przedział 11 - najbliższy niepusty to 15 (gęstość 1/20), F = 3/4
+    _with_changes(watcher, clock, [-165, -155, -145, -65, -55])
+    assert watcher._next_poll_delay() == 15.0
+
+
+def test_backs_off_after_longest_interval(clock):
+    watcher = listener()
+    _with_changes(watcher, clock, [-150, -140, -130, -120])
+    assert watcher._next_poll_delay() == 120
+    
+    _with_changes(watcher, clock, [-1030, -1020, -1010, -1000])
+    assert watcher._next_poll_delay() == main.POLL_MAX_DELAY
+
+
+def test_change_sample_is_modify_timestamp(clock):
+    clock.now = 1_767_225_600.0  # 2026-01-01 00:00:00 UTC
+    watcher = listener()
+    watcher._last_seen_ts = _generalized(clock.now - 3600)
+    
+    watcher._record_change(_generalized(clock.now - 120))
+    
+    assert list(watcher._change_times) == [clock.now - 120]
+
+
+def test_rereads_are_not_new_changes(clock):
+    clock.now = 1_767_225_600.0
+    watcher = listener()
+    watcher._last_seen_ts = _generalized(clock.now - 600)
+    watcher._record_change(_generalized(clock.now - 100))
+    
+    # Zakładka kursora, ten sam wpis ponownie i wpis starszy od ostatniej próbki
+    watcher._record_change(_generalized(clock.now - 700))
+    watcher._record_change(_generalized(clock.now - 100))
+    watcher._record_change(_generalized(clock.now - 300))
+    
+    assert list(watcher._change_times) == [clock.now - 100]
+
+
+def test_disabled_user_reread_in_overlap_is_not_recorded(clock):
+    clock.now = 1_767_225_600.0
+    watcher = listener()
+    watcher._last_seen_ts = _generalized(clock.now - 60)
+    disabled = entry(
+        f"uid=absolwent,ou=absolwenci,{BASE}",
+        uid="absolwent", mail="absolwent@zsel.opole.pl", nsAccountLock="TRUE",
+        modifyTimestamp=_generalized(clock.now - 120)
+    )
+    
+    for _ in range(3):
+        asyncio.run(watcher._handle_entry(disabled))
+        
+    assert len(watcher._change_times) == 0
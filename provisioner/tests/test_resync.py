@@ -0,0 +1,126 @@
+"""Testy resyncu: równoległe wyszukiwania zmian i kursor modifyTimestamp."""
+
+import asyncio
+
+from fakes import FakeMailboxManager, entry, pooled_listener
+
+BASE = "dc=zsel,dc=opole,dc=pl"
+CURSOR = "20260101000000Z"
+
+
+def _user(uid, ou, timestamp, **attributes):
+    return entry(
+        f"uid={uid},{ou},{BASE}", uid=uid, modifyTimestamp=timestamp, **attributes
+    )
+
+
+def _disabled(uid, timestamp):
+    return _user(
+        uid, "ou=absolwenci", timestamp,
+        mail=f"{uid}@zsel.opole.pl", nsAccountLock="TRUE"
+    )
+
+
+def _resync(subtrees, manager=None):
+    watcher = pooled_listener(subtrees, manager)
+    watcher._last_seen_ts = CURSOR
+    asyncio.run(watcher._process_changes())
+    return watcher
+
+
+def _searches(watcher):
+    searches = []
+    while not watcher._pool.empty():
+        searches.extend(watcher._pool.get_nowait().searches)
+    return searches
+
+
+def test_every_watched_ou_and_base_dn_is_searched():
+    watcher = _resync({})
+    
+    searched = {base for base, _ in _searches(watcher)}
+    assert searched == {
+        f"ou=uczniowie,{BASE}", f"ou=nauczyciele,{BASE}",
+        f"ou=administracja,{BASE}", BASE,
+    }
+
+
+def test_missing_ou_does_not_stop_resync():
+    manager = FakeMailboxManager()
+    watcher = _resync({
+        f"ou=nauczyciele,{BASE}": ([_user("anowak", "ou=nauczyciele", "20260102000000Z")], 0),
+        f"ou=administracja,{BASE}": ([], 0),
+        BASE: ([_disabled("absolwent", "20260103000000Z")], 0),
+    }, manager)
+    
+    assert ("archive", "absolwent") in manager.calls
+    assert watcher._last_seen_ts == "20260103000000Z"
+
+
+def test_failed_search_holds_cursor_but_not_other_subtrees():
+    manager = FakeMailboxManager()
+    watcher = _resync({
+        f"ou=uczniowie,{BASE}": ([], 4),  # sizeLimitExceeded
+        f"ou=nauczyciele,{BASE}": ([], 0),
+        f"ou=administracja,{BASE}": ([], 0),
+        BASE: ([_disabled("absolwent", "20260103000000Z")], 0),
+    }, manager)
+    
+    assert manager.calls == [("archive", "absolwent")]
+    assert watcher._last_seen_ts == CURSOR
+
+
+def _ou_changes(entries):
+    return {f"ou=uczniowie,{BASE}": (entries, 0)}
+
+
+def test_cursor_advances_to_newest_entry():
+    watcher = _resync(_ou_changes([
+        _user("a", "ou=uczniowie", "20260102000000Z"),
+        _user("b", "ou=uczniowie", "20260104000000Z"),
+    ]))
+    assert watcher._last_seen_ts == "20260104000000Z"
+
+
+def test_cursor_stops_at_oldest_failed_entry():
+    manager = FakeMailboxManager(create_ok=False)
+    watcher = _resync(_ou_changes([
+        _user("a", "ou=uczniowie", "20260103000000Z"),
+        _user("b", "ou=uczniowie", "20260102000000Z"),
+    ]), manager)
+    assert watcher._last_seen_ts == "20260102000000Z"
+
+
+def test_cursor_stops_at_failed_mail_write():
+    watcher = pooled_listener(_ou_changes([
+        _user("a", "ou=uczniowie", "20260102000000Z"),
+        _user("b", "ou=uczniowie", "20260104000000Z"),
+    ]))
+    watcher._last_seen_ts = CURSOR
+    
+    async def pipeline(operations):
+        return [
+            {'result': 50 if dn.startswith("uid=a,") else 0,
+             'description': 'insufficientAccessRights'}
+            for _, (dn, _) in operations
+        ]
+        
+    watcher._pipeline = pipeline
+    asyncio.run(watcher._process_changes())
+    
+    assert watcher._last_seen_ts == "20260102000000Z"
+
+
+def test_cursor_never_moves_back():
+    manager = FakeMailboxManager(create_ok=False)
+    # Wpis z zakładki (CURSOR_OVERLAP) - starszy niż kursor
+    watcher = _resync(
+        _ou_changes([_user("a", "ou=uczniowie", "20251231235900Z")]), manager
+    )
+    assert watcher._last_seen_ts == CURSOR
+
+
+def test_changes_filter_overlaps_cursor():
+    watcher = _resync({})
+    for _, search_filter in _searches(watcher):
+        assert search_filter.startswith("(&(modifyTimestamp>=20251231235500Z)")
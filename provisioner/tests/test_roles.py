@@ -0,0 +1,16 @@
+"""Testy wykrywania roli po OU."""
+
+import pytest
+
+from src.main import UserRole, _role_for_ou
+
+
+@pytest.mark.parametrize("ou, role", [
+    ("ou=uczniowie", UserRole.UCZEN),
+    ("ou=nauczyciele", UserRole.NAUCZYCIEL),
+    ("OU=Administracja", UserRole.ADMINISTRACJA),
+    ("ou=dyrekcja,dc=zsel,dc=opole,dc=pl", UserRole.DYREKCJA),
+    ("ou=inne", UserRole.UCZEN),
+])
+def test_role_for_ou(ou, role):
+    assert _role_for_ou(ou) is role
@@ -0,0 +1,151 @@
+"""Testy stanu provisionera (SQLite) i zapisu znaczników obsłużenia."""
+
+import asyncio
+import sqlite3
+
+from fakes import FakeMailboxManager, entry, pooled_listener
+from src import main
+from src.main import MailboxManager, MailConfig, ProvisionerState, UserRole
+
+BASE = "dc=zsel,dc=opole,dc=pl"
+
+
+def test_state_cursor_roundtrip(tmp_path):
+    path = str(tmp_path / "state.db")
+    state = ProvisionerState(path)
+    assert state.load_cursor() is None
+    
+    state.save_cursor("20260115120000Z")
+    assert ProvisionerState(path).load_cursor() == "20260115120000Z"
+
+
+def test_state_handled_ttl(clock):
+    state = ProvisionerState(":memory:", ttl=60)
+    state.update_handled([("jkowalski", "provisioned")], [])
+    assert state.is_handled("jkowalski", "provisioned")
+    assert not state.is_handled("jkowalski", "archived")
+    
+    clock.now += 60
+    assert not state.is_handled("jkowalski", "provisioned")
+
+
+def test_state_update_marks_and_forgets_in_one_call():
+    state = ProvisionerState(":memory:")
+    state.update_handled([("absolwent", "provisioned")], [])
+    
+    state.update_handled([("absolwent", "archived")], [("absolwent", "provisioned")])
+    
+    assert state.is_handled("absolwent", "archived")
+    assert not state.is_handled("absolwent", "provisioned")
+
+
+def test_state_prunes_expired_rows(clock):
+    state = ProvisionerState(":memory:", ttl=60)
+    state.update_handled([("stary", "provisioned")], [])
+    clock.now += 60
+    state.update_handled([("nowy", "provisioned")], [])
+    state.save_cursor("20260115120000Z")
+    
+    rows = state._db.execute("SELECT uid FROM handled").fetchall()
+    assert rows == [("nowy",)]
+
+
+def test_state_migrates_table_without_handled_at(tmp_path):
+    path = str(tmp_path / "state.db")
+    db = sqlite3.connect(path)
+    db.executescript(
+        """
+        CREATE TABLE handled (
+            uid TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            PRIMARY KEY (uid, kind)
+        );
+        INSERT INTO handled (uid, kind) VALUES ('jkowalski', 'provisioned');
+        """
+    )
+    db.close()
+    
+    state = ProvisionerState(path)
+    assert not state.is_handled("jkowalski", "provisioned")
+    state.update_handled([("jkowalski", "provisioned")], [])
+    assert state.is_handled("jkowalski", "provisioned")
+
+
+class CountingState(ProvisionerState):
+    """ProvisionerState liczący transakcje zapisu znaczników."""
+    
+    def __init__(self):
+        super().__init__(":memory:")
+        self.updates = []
+        
+    def update_handled(self, marked, forgotten):
+        self.updates.append((sorted(marked), sorted(forgotten)))
+        super().update_handled(marked, forgotten)
+
+
+def _manager(monkeypatch, state) -> MailboxManager:
+    manager = MailboxManager(MailConfig(), state)
+    
+    async def doveadm(command, **parameters):
+        return [{"mailbox": folder} for folder in main.DEFAULT_FOLDERS]
+        
+    monkeypatch.setattr(manager, "_doveadm", doveadm)
+    return manager
+
+
+def test_markers_are_written_on_flush_only(monkeypatch):
+    state = CountingState()
+    manager = _manager(monkeypatch, state)
+    
+    async def create_all():
+        await asyncio.gather(*(
+            manager.create_mailbox(uid, UserRole.UCZEN) for uid in ("a", "b", "c")
+        ))
+        
+    asyncio.run(create_all())
+    
+    assert state.updates == []
+    assert not state.is_handled("a", "provisioned")
+    # Niezapisany znacznik i tak chroni przed ponowną obsługą
+    manager._provisioned.discard("a")
+    assert manager._is_handled("a", "provisioned")
+    
+    manager.flush_handled()
+    manager.flush_handled()
+    
+    assert state.updates == [(
+        [("a", "provisioned"), ("b", "provisioned"), ("c", "provisioned")], []
+    )]
+    assert state.is_handled("c", "provisioned")
+
+
+def test_pending_forget_overrides_stored_marker():
+    state = CountingState()
+    state.update_handled([("absolwent", "archived")], [])
+    manager = MailboxManager(MailConfig(), state)
+    
+    manager.mark_active("absolwent")
+    
+    assert not manager._is_handled("absolwent", "archived")
+    manager.flush_handled()
+    assert state.updates[-1] == ([], [("absolwent", "archived")])
+    assert not state.is_handled("absolwent", "archived")
+
+
+def test_listener_flushes_markers_once_per_page():
+    users = [
+        entry(
+            f"uid=u{i},ou=uczniowie,{BASE}", uid=f"u{i}",
+            modifyTimestamp="20260115120000Z"
+        )
+        for i in range(3)
+    ]
+    manager = FakeMailboxManager()
+    watcher = pooled_listener(
+        {f"ou=uczniowie,{BASE}": (users, 0)}, manager
+    )
+    
+    asyncio.run(watcher._process_subtree(f"ou=uczniowie,{BASE}", "(uid=*)"))
+    
+    assert len([call for call in manager.calls if call[0] == "create"]) == 3
+    assert manager.flushes == 1